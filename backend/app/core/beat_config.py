@@ -1,11 +1,12 @@
-from celery import Celery
+from typing import NamedTuple
+
 from celery.schedules import crontab
-from app.core.celery_config import celery_app
 
 # Παράδειγμα για το κέντρο της Αθήνας και μια ακτίνα κάλυψης
 ATHENS_CENTER_LAT = 37.9838
 ATHENS_CENTER_LON = 23.7275
 DEFAULT_UPDATE_RADIUS_METERS = 50000  # 50 χιλιόμετρα, μπορείς να το προσαρμόσεις
+DEFAULT_UPDATE_GRID_SIZE = 3  # 3x3 αναζητήσεις, κάθε TomTom search επιστρέφει έως 100 αποτελέσματα
 
 # Παράδειγμα για το κέντρο της Θεσσαλονίκης
 THESSALONIKI_CENTER_LAT = 40.6401
@@ -20,22 +21,32 @@ DEFAULT_HISTORICAL_DAYS_TO_KEEP = 30
 # New: Speed Layer Polling Interval
 DEFAULT_SPEED_LAYER_POLLING_INTERVAL_SECONDS = 60 # Poll every 60 seconds
 
+class MonitoredLocation(NamedTuple):
+    """An area refreshed by the batch layer"""
+    name: str
+    latitude: float
+    longitude: float
+    radius: int = DEFAULT_UPDATE_RADIUS_METERS
+    grid_size: int = DEFAULT_UPDATE_GRID_SIZE
+
+# Περιοχές που ενημερώνει το batch layer - μία εγγραφή εδώ αρκεί για νέα πόλη
+MONITORED_LOCATIONS = (
+    MonitoredLocation("thessaloniki", THESSALONIKI_CENTER_LAT, THESSALONIKI_CENTER_LON),
+    MonitoredLocation("athens", ATHENS_CENTER_LAT, ATHENS_CENTER_LON),
+)
+
 # Configure Celery Beat schedule
 CELERY_BEAT_SCHEDULE = {
-    'update-stations-thessaloniki-area': {
-        'task': 'app.tasks.batch_tasks.batch_update_stations',
-        'schedule': crontab(minute='5,35'), # π.χ. στο :05 και :35 για να μην συμπίπτει ακριβώς
-        'args': (THESSALONIKI_CENTER_LAT, THESSALONIKI_CENTER_LON, DEFAULT_UPDATE_RADIUS_METERS),
-        'options': {'expires': 60 * 5},
-    },
-    'batch-update-athens-stations': {
-        'task': 'app.tasks.batch_tasks.batch_update_stations',
-        'schedule': crontab(minute=f'*/{DEFAULT_BATCH_UPDATE_INTERVAL_MINUTES}'), # Every X minutes
-        'args': (ATHENS_CENTER_LAT, ATHENS_CENTER_LON, DEFAULT_UPDATE_RADIUS_METERS),
-        'options': {'queue': 'batch_queue'} # Optional: route to a specific queue
+    # Ένα beat entry για όλες τις περιοχές - το fan-out γίνεται μέσα στον worker με group()
+    'batch-update-monitored-stations': {
+        'task': 'app.tasks.batch_tasks.batch_update_all_stations',
+        'schedule': crontab(minute=f"*/{DEFAULT_BATCH_UPDATE_INTERVAL_MINUTES}"), # Every X minutes
+        # Ως dicts στο μήνυμα: το msgpack θα έκανε τα NamedTuple απλές λίστες
+        'args': ([location._asdict() for location in MONITORED_LOCATIONS],),
+        'options': {'expires': 60 * 5, 'queue': 'batch_queue'},
     },
     'cleanup-old-historical-data': {
-        'task': 'app.tasks.batch_tasks.cleanup_old_historical_data_task',
+        'task': 'app.tasks.batch_tasks.cleanup_old_historical_data',
         'schedule': crontab(hour=DEFAULT_HISTORICAL_CLEANUP_CRON_HOUR, minute=DEFAULT_HISTORICAL_CLEANUP_CRON_MINUTE), # Daily at 2:00 AM
         'args': (DEFAULT_HISTORICAL_DAYS_TO_KEEP,), # Example: Keep data for 30 days
         'options': {'queue': 'batch_queue'}
@@ -45,8 +56,7 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'app.tasks.realtime_tasks.poll_station_availability',
         'schedule': DEFAULT_SPEED_LAYER_POLLING_INTERVAL_SECONDS, # Run every X seconds
         # No args needed for this task as it fetches all stations from DB
-        'options': {'queue': 'realtime_queue'} # Optional: route to a specific queue for speed layer tasks
+        # expires < interval: ένα καθυστερημένο poll δεν στοιβάζεται πάνω στο επόμενο
+        'options': {'expires': 30, 'queue': 'realtime_queue'}
     },
 }
-
-celery_app.conf.beat_schedule = CELERY_BEAT_SCHEDULE 
\ No newline at end of file
@@ -1,5 +1,7 @@
 from celery import Celery
+from celery.signals import worker_process_shutdown
 from app.core.config import settings
+from app.core.beat_config import CELERY_BEAT_SCHEDULE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,7 +12,8 @@ try:
         broker=settings.celery_broker_url,
         backend=settings.celery_result_backend,
         include=[
-            'app.tasks.batch_tasks'
+            'app.tasks.batch_tasks',
+            'app.tasks.realtime_tasks'
         ]
     )
     logger.info("Celery app created with broker and backend.")
@@ -22,9 +25,12 @@ except Exception as e:
 
 # Load Celery configuration
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    # msgpack: μικρότερα payloads και γρηγορότερο ser/de στον broker
+    # Το json μένει στα accept_content για tasks που στάλθηκαν πριν την αλλαγή
+    task_serializer='msgpack',
+    accept_content=['msgpack', 'json'],
+    result_serializer='msgpack',
+    result_accept_content=['msgpack', 'json'],
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
@@ -35,17 +41,40 @@ celery_app.conf.update(
     task_max_retries=3,
     task_ignore_result=False,
     result_expires=86400,  # Results expire after 24 hours
+    # Redis broker/backend connections
+    broker_pool_limit=50,
+    broker_transport_options={
+        # Πάνω από το task_time_limit, αλλιώς με acks_late ένα μακρύ task ξαναστέλνεται
+        'visibility_timeout': 3600 + 600,
+        'socket_keepalive': True,
+        'health_check_interval': 30,
+    },
+    result_backend_transport_options={'retry_policy': {'timeout': 5.0}},
+    # Το Redis result backend διαβάζει keepalive/health check από δικά του settings
+    redis_socket_keepalive=True,
+    redis_backend_health_check_interval=30,
+    beat_schedule=CELERY_BEAT_SCHEDULE,
+    # Το schedule state ζει στο Redis αντί για το shelve αρχείο celerybeat-schedule
+    beat_scheduler='redbeat.RedBeatScheduler',
+    redbeat_redis_url=settings.redis_url,
+    # Ξεχωριστές ουρές ώστε τα γρήγορα realtime polls να μην περιμένουν πίσω από batch jobs:
+    #   celery -A app.core.celery_config worker -Q batch_queue -c 2
+    #   celery -A app.core.celery_config worker -Q realtime_queue -c 8
+    task_routes={
+        'app.tasks.batch_tasks.*': {'queue': 'batch_queue'},
+        'app.tasks.realtime_tasks.*': {'queue': 'realtime_queue'},
+    },
 )
 
-# Autodiscover tasks in all installed apps
-# This will automatically find tasks in app/tasks/*.py
-celery_app.autodiscover_tasks(['app.tasks'])
+# Τα repositories δημιουργούνται lazily στο πρώτο task (get_station_repository) και όχι στο
+# worker_process_init: το create_index των constructors μπορεί να ξεπεράσει το timeout
+# με το οποίο το Celery σκοτώνει ένα child που δεν ολοκληρώνει την αρχικοποίηση
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Close the worker process MongoDB clients"""
+    # Lazy import: τα repositories εισάγουν το config, όχι το αντίστροφο
+    from app.repositories import close_repositories
+    close_repositories()
 
 # Log Celery configuration
 logger.info("Celery configuration loaded with Redis broker and backend")
-
-CELERY_IMPORTS = (
-    'app.tasks.batch_tasks',
-    'app.tasks.user_tasks',
-    'app.tasks.realtime_tasks'
-) 
\ No newline at end of file
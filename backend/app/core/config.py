@@ -1,16 +1,38 @@
-from pydantic_settings import BaseSettings
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
+from functools import lru_cache
 import os
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding='utf-8',
+        extra='ignore',
+        case_sensitive=False
+    )
+
     # Database settings
     mongodb_url: str
     database_name: str
+    mongodb_min_pool_size: int = 10
+    mongodb_max_pool_size: int = 50
+    mongodb_server_selection_timeout_ms: int = 2000
+    # Μέγιστη αναμονή για ελεύθερο socket του pool (None = driver default, χωρίς όριο)
+    mongodb_wait_queue_timeout_ms: Optional[int] = None
+    # Idle sockets κλείνουν μετά από 5 λεπτά, το minPoolSize (μόνο στον κοινό client) κρατά τα υπόλοιπα ζεστά
+    mongodb_max_idle_time_ms: int = 300000
+    # Unacknowledged (w=0) inserts για τα ιστορικά snapshots του batch layer
+    historical_fast_insert: bool = False
+    # Το zstd θέλει το πακέτο zstandard - αν λείπει, ο driver πέφτει στο zlib
+    mongodb_compressors: str = "zstd,zlib"
     
     # TomTom API Keys
     tomtom_api_key: str
     tomtom_ev_api_key: Optional[str] = None
     tomtom_base_url: str = "https://api.tomtom.com"
+    # TTL του in-memory cache για τα async TomTom searches (0 = χωρίς cache)
+    tomtom_cache_ttl_seconds: int = 60
     
     # CORS settings
     cors_origins: List[str] = []
@@ -28,10 +50,15 @@ class Settings(BaseSettings):
     
     # Redis settings (for caching or other purposes)
     redis_url: str
+    redis_max_connections: int = 100
     
     # App settings
     app_name: str = "EV Charging Stations API"
     debug: bool = True
+    # Worker processes του uvicorn όταν δεν τρέχει με reload (development)
+    uvicorn_workers: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    # Bearer token για το /metrics (None = χωρίς έλεγχο, μόνο πίσω από εσωτερικό δίκτυο)
+    metrics_token: Optional[str] = None
     
     # Celery settings
     celery_broker_url: str
@@ -42,13 +69,13 @@ class Settings(BaseSettings):
     pusher_key: Optional[str] = None
     pusher_secret: Optional[str] = None
     pusher_cluster: Optional[str] = None
-    
-    class Config:
-        env_file = ".env"
-        env_file_encoding = 'utf-8'
-        extra = 'ignore'
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings instance (το .env διαβάζεται μία φορά)"""
+    return Settings()
+
+settings = get_settings()
 
 # Logging για επιβεβαίωση
 import logging
@@ -61,7 +88,7 @@ else:
     # ίσως δεν χρειάζεται warning, αλλά ένα info ή debug log.
     logger.info("TomTom EV API key not configured (optional).")
 
-logger.info(f"Loaded Celery Broker URL: {settings.celery_broker_url}")
-logger.info(f"Loaded Celery Result Backend: {settings.celery_result_backend}")
-logger.info(f"CORS Origins: {settings.cors_origins}")
-logger.info(f"Debug mode: {settings.debug}")
\ No newline at end of file
+logger.info("Loaded Celery Broker URL: %s", settings.celery_broker_url)
+logger.info("Loaded Celery Result Backend: %s", settings.celery_result_backend)
+logger.info("CORS Origins: %s", settings.cors_origins)
+logger.info("Debug mode: %s", settings.debug)
\ No newline at end of file
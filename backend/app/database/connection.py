@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 from app.core.config import settings
 import logging
 
@@ -9,6 +10,22 @@ class Database:
 
 db = Database()
 
+def mongo_client_kwargs(min_pool_size: int = 0) -> dict:
+    """Pool, timeout and compression options for a MongoDB client (motor or pymongo)"""
+    # minPoolSize > 0 μόνο για τον κοινό client του request path - αλλιώς κάθε client
+    # κάθε process κρατά ανοιχτά idle sockets για πάντα
+    kwargs = {
+        "minPoolSize": min_pool_size,
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        # Γρήγορο fail αντί για 30s αναμονή όταν η βάση δεν είναι διαθέσιμη
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "maxIdleTimeMS": settings.mongodb_max_idle_time_ms,
+        "compressors": settings.mongodb_compressors,
+    }
+    if settings.mongodb_wait_queue_timeout_ms is not None:
+        kwargs["waitQueueTimeoutMS"] = settings.mongodb_wait_queue_timeout_ms
+    return kwargs
+
 def get_database():
     """Get database instance synchronously"""
     return db.client[settings.database_name]
@@ -16,9 +33,15 @@ def get_database():
 async def connect_to_mongo():
     """Create database connection"""
     try:
-        db.client = AsyncIOMotorClient(settings.mongodb_url)
+        db.client = AsyncIOMotorClient(
+            settings.mongodb_url, **mongo_client_kwargs(min_pool_size=settings.mongodb_min_pool_size)
+        )
         # Test the connection
         await db.client.admin.command('ping')
+        # Ταυτόχρονα pings ώστε το pool να ανοίξει sockets πριν το πρώτο request
+        await asyncio.gather(
+            *[db.client.admin.command('ping') for _ in range(settings.mongodb_min_pool_size)]
+        )
         logger.info(f"Connected to MongoDB: {settings.database_name}")
     except Exception as e:
         logger.error(f"Error connecting to MongoDB: {e}")
@@ -1,28 +1,72 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+import orjson
 import uvicorn
+from prometheus_fastapi_instrumentator import Instrumentator
+from prometheus_client import CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+import asyncio
+import hashlib
+import hmac
 import logging
+import os
+import shutil
+import sys
 import time
-from datetime import datetime
+import uuid
+from contextlib import asynccontextmanager
 
 from app.core.config import settings
-from app.database.connection import connect_to_mongo, close_mongo_connection
+from app.database.connection import connect_to_mongo, close_mongo_connection, get_database
 from app.services.tomtom_service import tomtom_service
 from app.core.exceptions import TomTomAPIException
-from app.repositories import repositories
+from app.repositories import repositories, init_repositories, close_repositories, station_repository_dependency, historical_repository_dependency
+from app.repositories.station_repository import StationRepository
+from app.repositories.historical_repository import HistoricalStationRepository
 from app.models.user import User, UserPreferences
 from app.models.event import Event
 from app.services.opencharge_service import opencharge_service
 from app.models.station import Station, StationLocation, ConnectorInfo, OperatorInfo
+from app.tasks.batch_tasks import batch_update_stations, batch_update_lock_key, BATCH_UPDATE_LOCK_TTL_SECONDS, RELEASE_BATCH_UPDATE_LOCK_SCRIPT
+from app.utils.redis_client import get_async_redis, close_async_redis
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Cache για το /health ώστε τα συχνά probes να μην κάνουν metadata query σε κάθε κλήση
+HEALTH_COLLECTIONS_CACHE_TTL_SECONDS = 30
+_collections_cache: tuple[float, list[str]] | None = None
+_collections_cache_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize database connection on startup and release resources on shutdown"""
+    # Τα station/historical repositories έχουν δικούς τους clients και φτιάχνουν indexes
+    # με blocking pymongo κλήσεις - τρέχουν σε thread, παράλληλα με το Mongo handshake
+    await asyncio.gather(
+        connect_to_mongo(),
+        asyncio.to_thread(init_repositories)
+    )
+    await repositories.users.ensure_indexes()
+    logger.info("Application startup complete")
+    yield
+    await asyncio.gather(
+        close_mongo_connection(),
+        tomtom_service.close(),
+        close_async_redis(),
+        # Οι motor/pymongo clients των repositories κλείνουν με blocking κλήσεις
+        asyncio.to_thread(close_repositories)
+    )
+    logger.info("Application shutdown complete")
+
 app = FastAPI(
     title=settings.app_name,
     description="API for managing EV charging stations with real-time notifications",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -37,40 +81,93 @@ if settings.cors_origins:
 else:
     pass
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database connection on startup"""
-    await connect_to_mongo()
-    # Αρχικοποίηση των repositories μετά τη σύνδεση στη βάση δεδομένων
-    from app.repositories import init_repositories
-    init_repositories()
-    logger.info("Application startup complete")
+# Συμπίεση για τα μεγάλα JSON responses - τα μικρά (π.χ. /health) μένουν ως έχουν
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Close database connection on shutdown"""
-    await close_mongo_connection()
-    await tomtom_service.close()
-    logger.info("Application shutdown complete")
+# Latency histograms ανά endpoint - εκτίθενται από το δικό μας /metrics endpoint
+Instrumentator(excluded_handlers=["/metrics"]).instrument(app)
+
+def build_metrics_registry() -> CollectorRegistry:
+    """Registry served by /metrics, aggregated across workers in multiprocess mode"""
+    # Με πολλούς uvicorn workers κάθε process έχει δικό του registry. Με PROMETHEUS_MULTIPROC_DIR
+    # τα metrics γράφονται σε αρχεία και το MultiProcessCollector τα αθροίζει σε κάθε scrape
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+METRICS_REGISTRY = build_metrics_registry()
+
+# Στατικό περιεχόμενο - σειριοποιείται μία φορά στο import
+ROOT_RESPONSE_BODY = orjson.dumps({
+    "message": "EV Charging Stations API",
+    "status": "running",
+    "version": "1.0.0"
+})
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus metrics endpoint"""
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=generate_latest(METRICS_REGISTRY), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {
-        "message": "EV Charging Stations API",
-        "status": "running",
-        "version": "1.0.0"
-    }
+    return Response(content=ROOT_RESPONSE_BODY, media_type="application/json")
+
+async def get_cached_collection_names() -> list[str]:
+    """Return the database collection names, refreshed at most every HEALTH_COLLECTIONS_CACHE_TTL_SECONDS"""
+    global _collections_cache
+    async with _collections_cache_lock:
+        now = time.monotonic()
+        if _collections_cache is None or now - _collections_cache[0] > HEALTH_COLLECTIONS_CACHE_TTL_SECONDS:
+            db = get_database()
+            _collections_cache = (now, await db.list_collection_names())
+        return _collections_cache[1]
+
+NEARBY_CACHE_TTL_SECONDS = 30
+
+async def get_cached_nearby_summaries(
+    station_repo: StationRepository,
+    latitude: float,
+    longitude: float,
+    radius_meters: int,
+    limit: int
+) -> list[dict]:
+    """Nearby station summaries, served from Redis for NEARBY_CACHE_TTL_SECONDS"""
+    redis_client = get_async_redis()
+    cache_key = f"near:{round(latitude, 3)}:{round(longitude, 3)}:{radius_meters}:{limit}"
+    try:
+        cached = await redis_client.get(cache_key)
+        if cached:
+            return orjson.loads(cached)
+    except Exception as e:
+        # Χωρίς Redis απλώς πάμε στη βάση
+        logger.warning(f"Nearby cache read failed: {e}")
+    
+    stations = await station_repo.get_nearby_station_summaries(
+        latitude=latitude,
+        longitude=longitude,
+        radius_meters=radius_meters,
+        limit=limit
+    )
+    try:
+        await redis_client.set(cache_key, orjson.dumps(stations), ex=NEARBY_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Nearby cache write failed: {e}")
+    return stations
 
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
     try:
-        from app.database.connection import get_database
-        
-        db = get_database()
-        # Test database connection
-        collections = await db.list_collection_names()
+        # Test database connection (cached)
+        collections = await get_cached_collection_names()
         
         return {
             "status": "healthy",
@@ -86,7 +183,7 @@ async def health_check():
         }
 
 @app.get("/test/tomtom")
-async def test_tomtom_api(lat: float = 37.9755, lon: float = 23.7348, radius: int = 5000):
+async def test_tomtom_api(request: Request, lat: float = 37.9755, lon: float = 23.7348, radius: int = 5000):
     """
     Test endpoint for TomTom API integration
     Default coordinates are for Athens, Greece
@@ -97,39 +194,20 @@ async def test_tomtom_api(lat: float = 37.9755, lon: float = 23.7348, radius: in
         # Get stations from TomTom API
         stations = await tomtom_service.get_stations_in_area(lat, lon, radius)
         
-        return {
+        body = orjson.dumps({
             "success": True,
             "message": f"Successfully retrieved {len(stations)} charging stations",
             "coordinates": {"lat": lat, "lon": lon, "radius": radius},
             "stations_count": len(stations),
             "stations": [
-                {
-                    "tomtom_id": station.tomtom_id,
-                    "name": station.name,
-                    "address": {
-                        "street": station.address.street,
-                        "city": station.address.city,
-                        "country": station.address.country
-                    },
-                    "location": {
-                        "lat": station.location.coordinates[1],
-                        "lon": station.location.coordinates[0]
-                    },
-                    "status": station.status,
-                    "connectors_count": len(station.connectors),
-                    "connectors": [
-                        {
-                            "id": conn.id,
-                            "type": conn.type,
-                            "power_kw": conn.power_kw,
-                            "status": conn.status
-                        } for conn in station.connectors
-                    ],
-                    "operator": station.operator.name if station.operator else None,
-                    "data_source": station.data_source
-                } for station in stations[:5]  # Show only first 5 stations for readability
+                station.to_summary_dict() for station in stations[:5]  # Show only first 5 stations for readability
             ]
-        }
+        })
+        # ETag από το περιεχόμενο: ίδια δεδομένα -> 304 χωρίς body
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
         
     except TomTomAPIException as e:
         logger.error(f"TomTom API error: {e}")
@@ -166,7 +244,8 @@ async def test_tomtom_raw(lat: float = 37.9755, lon: float = 23.7348, radius: in
             "success": True,
             "message": f"Raw TomTom API response with {len(tomtom_stations)} stations",
             "coordinates": {"lat": lat, "lon": lon, "radius": radius},
-            "raw_stations": [station.dict() for station in tomtom_stations[:3]]  # Show first 3 raw stations
+            # mode="json": το pydantic-core βγάζει έτοιμους JSON τύπους (ObjectId/datetime -> str)
+            "raw_stations": [station.model_dump(mode="json") for station in tomtom_stations[:3]]  # Show first 3 raw stations
         }
         
     except Exception as e:
@@ -184,7 +263,8 @@ async def test_repositories():
     """Test repository functionality"""
     try:
         # Test station repository
-        stations_count = await repositories.stations.count()
+        # Μόνο για εμφάνιση - αρκεί το metadata count
+        stations_count = await repositories.stations.estimated_count()
         
         # Generate unique email για κάθε test
         unique_email = f"test_{int(time.time())}@example.com"
@@ -242,11 +322,9 @@ async def test_repositories():
         )
 
 @app.get("/test/station-operations")
-async def test_station_operations():
+async def test_station_operations(station_repo: StationRepository = Depends(station_repository_dependency)):
     """Test station operations"""
     try:
-        from app.repositories import station_repo
-        
         # Κέντρο Αθήνας με μεγάλη εμβέλεια
         athens_lat = 37.9755  # Κέντρο Αθήνας
         athens_lon = 23.7348  # Κέντρο Αθήνας
@@ -254,11 +332,14 @@ async def test_station_operations():
         
         logger.info(f"Testing station operations at Athens center: ({athens_lat}, {athens_lon}) with {radius}m radius")
         
-        # Test TomTom API
-        tomtom_stations = await tomtom_service.search_charging_stations(
-            latitude=athens_lat,
-            longitude=athens_lon,
-            radius=radius
+        # Test TomTom API - παράλληλα με το count της βάσης (ανεξάρτητα I/O)
+        tomtom_stations, stations_before = await asyncio.gather(
+            tomtom_service.search_charging_stations(
+                latitude=athens_lat,
+                longitude=athens_lon,
+                radius=radius
+            ),
+            station_repo.estimated_count()
         )
         
         logger.info(f"TomTom returned {len(tomtom_stations)} stations")
@@ -268,7 +349,8 @@ async def test_station_operations():
         logger.info(f"Upserted stations: {upsert_result}")
         
         # Get nearby stations using repository
-        nearby_stations = await station_repo.get_nearby_stations(
+        nearby_stations = await get_cached_nearby_summaries(
+            station_repo,
             latitude=athens_lat,
             longitude=athens_lon,
             radius_meters=radius,
@@ -281,16 +363,17 @@ async def test_station_operations():
             "results": {
                 "test_location": f"Athens Center ({athens_lat}, {athens_lon})",
                 "search_radius_km": radius/1000.0,
+                "stations_in_db_before": stations_before,
                 "tomtom_stations_fetched": len(tomtom_stations),
                 "upsert_result": upsert_result,
                 "nearby_stations_found": len(nearby_stations),
                 "sample_nearby_stations": [
                     {
-                        "tomtom_id": station.tomtom_id,
-                        "name": station.name,
-                        "address": station.address,
-                        "operator": station.operator.name,
-                        "status": station.status
+                        "tomtom_id": station.get("tomtom_id"),
+                        "name": station.get("name"),
+                        "address": station.get("address"),
+                        "operator": station.get("operator", {}).get("name"),
+                        "status": station.get("status")
                     }
                     for station in nearby_stations
                 ]
@@ -305,11 +388,7 @@ async def test_station_operations():
         )
 
 @app.get("/test/historical-save")
-async def test_historical_save():
-    from app.repositories import historical_repo
-    from app.models.station import Station, StationLocation, ConnectorInfo, OperatorInfo
-    from datetime import datetime
-    
+async def test_historical_save(historical_repo: HistoricalStationRepository = Depends(historical_repository_dependency)):
     test_station = Station(
         tomtom_id="test_historical_123",
         name="Test Historical Station",
@@ -333,19 +412,10 @@ async def test_historical_save():
     )
     
     # Προσθήκη των απαιτούμενων πεδίων για την ιστορική εγγραφή
-    historical_data = test_station.dict(by_alias=True)
+    historical_data = test_station.model_dump(by_alias=True, exclude={"id"})
     historical_data['station_id'] = test_station.tomtom_id
-    historical_data['status_snapshot'] = {
-        "station_status": test_station.status,
-        "total_connectors": len(test_station.connectors),
-        "available_connectors": sum(1 for c in test_station.connectors if c.status == "AVAILABLE"),
-        "occupied_connectors": sum(1 for c in test_station.connectors if c.status == "OCCUPIED"),
-        "out_of_order_connectors": sum(1 for c in test_station.connectors if c.status == "OUT_OF_ORDER")
-    }
-    historical_data['timestamp'] = datetime.utcnow()
-    
-    if '_id' in historical_data:
-        del historical_data['_id']
+    historical_data['status_snapshot'] = test_station.status_snapshot()
+    # Το timestamp το ορίζει το save_historical_data
     
     saved_id = await historical_repo.save_historical_data(historical_data)
     return {
@@ -362,12 +432,29 @@ async def trigger_batch_update_stations(
 ):
     """Trigger batch update of stations data"""
     try:
-        from app.tasks.batch_tasks import batch_update_stations
-        
         logger.info(f"Triggering batch update for stations at ({lat}, {lon}) with radius {radius}m")
         
+        # In-flight lock: ένα μόνο batch task ανά (lat, lon, radius) κάθε φορά
+        redis_client = get_async_redis()
+        lock_key = batch_update_lock_key(lat, lon, radius)
+        task_id = str(uuid.uuid4())
+        acquired = await redis_client.set(lock_key, task_id, nx=True, ex=BATCH_UPDATE_LOCK_TTL_SECONDS)
+        if not acquired:
+            existing_task_id = await redis_client.get(lock_key)
+            return {
+                "success": True,
+                "message": f"Batch update already in progress for stations at ({lat}, {lon})",
+                "task_id": existing_task_id,
+                "location": {"latitude": lat, "longitude": lon, "radius": radius}
+            }
+        
         # Trigger the Celery task asynchronously without await
-        task = batch_update_stations.apply_async(args=(lat, lon, radius))
+        try:
+            task = batch_update_stations.apply_async(args=(lat, lon, radius), task_id=task_id)
+        except Exception:
+            # Το task δεν έφτασε στον broker - το lock δεν πρέπει να μπλοκάρει τις επόμενες κλήσεις
+            await redis_client.eval(RELEASE_BATCH_UPDATE_LOCK_SCRIPT, 1, lock_key, task_id)
+            raise
         
         return {
             "success": True,
@@ -384,10 +471,23 @@ async def trigger_batch_update_stations(
         )
 
 if __name__ == "__main__":
+    # Καθαρισμός των metrics αρχείων από προηγούμενο run, πριν ξεκινήσουν οι workers
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+    elif not settings.debug and settings.uvicorn_workers > 1:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set - /metrics will only reflect the worker that serves the scrape")
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
+        # Το autoreload (fs watcher) μόνο στο development
+        reload=settings.debug,
+        # Το reload δεν συνδυάζεται με workers
+        workers=None if settings.debug else settings.uvicorn_workers,
+        log_level="info",
+        # uvloop/httptools δεν υποστηρίζονται στα Windows
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools"
     )
\ No newline at end of file
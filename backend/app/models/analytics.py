@@ -1,5 +1,5 @@
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from bson import ObjectId
 from app.models.station import PyObjectId
@@ -23,13 +23,14 @@ class DailyMetrics(BaseModel):
 class Analytics(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     station_id: str
-    date: str = Field(..., regex=r'^\d{4}-\d{2}-\d{2}$')  # YYYY-MM-DD format
+    date: str = Field(..., pattern=r'^\d{4}-\d{2}-\d{2}$')  # YYYY-MM-DD format
     metrics: DailyMetrics
     hourly_data: Optional[List[HourlyData]] = []
     computed_at: datetime = Field(default_factory=datetime.utcnow)
     data_quality_score: float = Field(1.0, ge=0, le=1)  # 0-1 score
     
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str} 
\ No newline at end of file
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        json_encoders={ObjectId: str}
+    )
\ No newline at end of file
@@ -1,5 +1,5 @@
 from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from bson import ObjectId
 from app.models.station import PyObjectId
@@ -25,7 +25,8 @@ class Notification(BaseModel):
     retry_count: int = 0
     error_message: Optional[str] = None
     
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str} 
\ No newline at end of file
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        json_encoders={ObjectId: str}
+    )
\ No newline at end of file
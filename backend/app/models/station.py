@@ -1,22 +1,33 @@
+from collections import Counter
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic_core import core_schema
 
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        # Το schema χτίζεται μία φορά ανά κλάση· σε JSON γίνεται string
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str, when_used="json")
+        )
 
     @classmethod
-    def validate(cls, v, handler):
-        if not ObjectId.is_valid(v):
+    def validate(cls, v):
+        if isinstance(v, ObjectId):
+            return v
+        # Ένα parse αντί για is_valid() + ObjectId()
+        try:
+            return ObjectId(v)
+        except (InvalidId, TypeError):
             raise ValueError("Invalid objectid")
-        return ObjectId(v)
 
     @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 class StationLocation(BaseModel):
     type: str = "Point"
@@ -57,11 +68,46 @@ class Station(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     availability_status_changes_count: int = Field(default=0, description="Cumulative count of availability status changes")
     
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
-        json_schema_extra = {
+    def status_snapshot(self) -> Dict[str, Any]:
+        """Station status and connector counts per status, as stored in historical records"""
+        # Ένα πέρασμα στους connectors για όλα τα status counts
+        connector_counts = Counter(c.status for c in self.connectors)
+        return {
+            "station_status": self.status,
+            "total_connectors": len(self.connectors),
+            "available_connectors": connector_counts.get("AVAILABLE", 0),
+            "occupied_connectors": connector_counts.get("OCCUPIED", 0),
+            "out_of_order_connectors": connector_counts.get("OUT_OF_ORDER", 0)
+        }
+    
+    def to_summary_dict(self) -> Dict[str, Any]:
+        """Compact API representation of the station (used by /test/tomtom)"""
+        return {
+            "tomtom_id": self.tomtom_id,
+            "name": self.name,
+            "address": self.address,
+            "location": {
+                "lat": self.location.coordinates[1],
+                "lon": self.location.coordinates[0]
+            },
+            "status": self.status,
+            "connectors_count": len(self.connectors),
+            "connectors": [
+                {
+                    "id": conn.id,
+                    "type": conn.type,
+                    "max_power_kw": conn.max_power_kw,
+                    "status": conn.status
+                } for conn in self.connectors
+            ],
+            "operator": self.operator.name if self.operator else None
+        }
+    
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        json_encoders={ObjectId: str},
+        json_schema_extra={
             "example": {
                 "tomtom_id": "12345",
                 "name": "EV Station Downtown",
@@ -85,4 +131,5 @@ class Station(BaseModel):
                 },
                 "status": "AVAILABLE"
             }
-        }
\ No newline at end of file
+        }
+    )
\ No newline at end of file
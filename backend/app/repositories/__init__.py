@@ -15,7 +15,8 @@ class Repositories:
     @property
     def stations(self):
         if self._stations is None:
-            self._stations = station_repository
+            init_repositories()
+            self._stations = station_repo
         return self._stations
     
     @property
@@ -41,8 +42,38 @@ station_repo = None
 historical_repo = None
 
 def init_repositories():
+    # Κάθε repository ανοίγει δικούς του clients, οπότε δημιουργείται μία φορά ανά process
     global station_repo, historical_repo
-    station_repo = StationRepository()
-    historical_repo = HistoricalStationRepository()
+    if station_repo is None:
+        station_repo = StationRepository()
+    if historical_repo is None:
+        historical_repo = HistoricalStationRepository()
+
+def close_repositories():
+    # Κλείσιμο των clients, π.χ. στο shutdown ενός Celery worker process
+    global station_repo, historical_repo
+    if station_repo is not None:
+        station_repo.close()
+        station_repo = None
+    if historical_repo is not None:
+        historical_repo.close()
+        historical_repo = None
+    repositories._stations = None
+
+def get_station_repository() -> StationRepository:
+    init_repositories()
+    return station_repo
+
+def get_historical_repository() -> HistoricalStationRepository:
+    init_repositories()
+    return historical_repo
+
+# FastAPI dependencies: async ώστε να μην περνούν από το threadpool σε κάθε request.
+# Τα repositories έχουν ήδη δημιουργηθεί στο lifespan, οπότε η κλήση δεν μπλοκάρει
+async def station_repository_dependency() -> StationRepository:
+    return get_station_repository()
+
+async def historical_repository_dependency() -> HistoricalStationRepository:
+    return get_historical_repository()
 
 repositories = Repositories() 
\ No newline at end of file
@@ -4,6 +4,7 @@ from motor.motor_asyncio import AsyncIOMotorCollection
 from pydantic import BaseModel
 from bson import ObjectId
 from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,14 +19,17 @@ class BaseRepository(Generic[ModelType], ABC):
     async def create(self, obj: ModelType) -> ModelType:
         """Create a new document"""
         try:
-            obj_dict = obj.dict(by_alias=True, exclude_unset=False)
+            obj_dict = obj.model_dump(by_alias=True, exclude_unset=False)
             if "_id" in obj_dict and obj_dict["_id"] is None:
                 del obj_dict["_id"]
             
             result = await self.collection.insert_one(obj_dict)
-            obj_dict["_id"] = result.inserted_id
             
-            return self.model_class(**obj_dict)
+            # Το obj έχει ήδη γίνει validate - αντιγραφή χωρίς νέο validation
+            return obj.model_copy(update={"id": result.inserted_id})
+        except DuplicateKeyError:
+            # Αναμενόμενο σφάλμα (π.χ. υπάρχον email) - το χειρίζεται ο caller
+            raise
         except Exception as e:
             logger.error(f"Error creating document: {e}")
             raise
@@ -108,6 +112,14 @@ class BaseRepository(Generic[ModelType], ABC):
             logger.error(f"Error counting documents: {e}")
             raise
     
+    async def estimated_count(self) -> int:
+        """Approximate total document count from collection metadata (no scan)"""
+        try:
+            return await self.collection.estimated_document_count()
+        except Exception as e:
+            logger.error(f"Error estimating document count: {e}")
+            raise
+    
     async def exists(self, filter_dict: Dict[str, Any]) -> bool:
         """Check if document exists"""
         try:
@@ -2,6 +2,8 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from app.models.station import Station
 import pymongo
+from pymongo.write_concern import WriteConcern
+from app.database.connection import mongo_client_kwargs
 from app.core.config import settings
 import logging
 
@@ -13,15 +15,23 @@ class HistoricalStationRepository:
         logger.info("Creating database connection for HistoricalStationRepository")
         try:
             import motor.motor_asyncio
-            client = motor.motor_asyncio.AsyncIOMotorClient(settings.mongodb_url)
+            # connect=False: καμία σύνδεση μέχρι την πρώτη λειτουργία (ασφαλές σε fork)
+            client = motor.motor_asyncio.AsyncIOMotorClient(settings.mongodb_url, connect=False, **mongo_client_kwargs())
             self.db = client[settings.database_name]
         except Exception as e:
             logger.error(f"Error creating database connection: {str(e)}")
             raise
         self.collection = self.db["historical_stations"]
         # Προσθήκη σύγχρονου client για pymongo
-        self.sync_db = pymongo.MongoClient(settings.mongodb_url)
+        self.sync_db = pymongo.MongoClient(settings.mongodb_url, **mongo_client_kwargs())
         self.sync_collection = self.sync_db[settings.database_name]["historical_stations"]
+        # Compound index ώστε το get_station_history να εξυπηρετεί και το sort από το index
+        self.sync_collection.create_index([("tomtom_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)])
+
+    def close(self):
+        """Close the async and sync MongoDB clients of this repository"""
+        self.db.client.close()
+        self.sync_db.close()
     
     async def save_historical_data(self, data: dict) -> str:
         """Save historical data for a station"""
@@ -60,7 +70,8 @@ class HistoricalStationRepository:
             }
         }
         
-        data = await self.collection.find(query).sort("timestamp", 1).to_list(length=1000)
+        cursor = self.collection.find(query).sort("timestamp", 1).batch_size(1000)
+        data = await cursor.to_list(length=1000)
         return data
     
     async def cleanup_old_data(self, days_to_keep: int = 30) -> int:
@@ -71,12 +82,16 @@ class HistoricalStationRepository:
         })
         return result.deleted_count
     
-    def save_historical_batch_sync(self, historical_data: List[Dict[str, Any]]) -> int:
-        """Save a batch of historical data to the database (synchronous)"""
+    def save_historical_batch_sync(self, historical_data: List[Dict[str, Any]], fast_insert: bool = False) -> int:
+        """Save a batch of historical data to the database (synchronous); fast_insert skips the write acknowledgement"""
         try:
             if not historical_data:
                 return 0
-            result = self.sync_collection.insert_many(historical_data, ordered=False)
+            collection = self.sync_collection
+            if fast_insert:
+                # w=0: ο driver δεν περιμένει απάντηση από τον server - πιθανές αποτυχίες δεν αναφέρονται
+                collection = collection.with_options(write_concern=WriteConcern(w=0))
+            result = collection.insert_many(historical_data, ordered=False)
             return len(result.inserted_ids)
         except Exception as e:
             logger.error(f"Error saving historical batch (sync): {e}")
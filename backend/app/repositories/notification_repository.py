@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from app.repositories.base_repository import BaseRepository
 from app.models.notification import Notification
 from bson import ObjectId
+from pymongo import ReturnDocument
 import logging
 
 logger = logging.getLogger(__name__)
@@ -63,15 +64,26 @@ class NotificationRepository(BaseRepository[Notification]):
         )
     
     async def mark_as_failed(self, notification_id: str, error_message: str) -> Optional[Notification]:
-        """Mark notification as failed"""
-        return await self.update_by_id(
-            notification_id,
-            {
-                "status": "FAILED",
-                "error_message": error_message,
-                "retry_count": {"$inc": 1}
-            }
-        )
+        """Mark notification as failed and increment its retry count atomically"""
+        try:
+            result = await self.collection.find_one_and_update(
+                {"_id": ObjectId(notification_id)},
+                {
+                    "$set": {
+                        "status": "FAILED",
+                        "error_message": error_message
+                    },
+                    "$inc": {"retry_count": 1}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            
+            if result:
+                return self.model_class(**result)
+            return None
+        except Exception as e:
+            logger.error(f"Error marking notification {notification_id} as failed: {e}")
+            raise
     
     async def get_daily_notification_count(self, user_id: str, date: datetime = None) -> int:
         """Get notification count for user for a specific day"""
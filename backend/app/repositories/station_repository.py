@@ -1,14 +1,18 @@
 from typing import List, Optional, Dict, Any
 from pymongo import ASCENDING, DESCENDING, GEOSPHERE
 import pymongo
+from pymongo.results import BulkWriteResult
 from app.repositories.base_repository import BaseRepository
 from app.models.station import Station, StationLocation, ConnectorInfo
 from datetime import datetime
 import logging
+from app.database.connection import mongo_client_kwargs
 from app.core.config import settings  # Προσθήκη για να πάρουμε τη MongoDB URL
 
 logger = logging.getLogger(__name__)
 
+BULK_WRITE_BATCH_SIZE = 1000 # Μέγιστα ops ανά bulk_write εντολή
+
 class StationRepository(BaseRepository[Station]):
     def __init__(self):
         # Lazy initialization
@@ -17,17 +21,21 @@ class StationRepository(BaseRepository[Station]):
         logger.info("Creating database connection for StationRepository")
         try:
             import motor.motor_asyncio
-            client = motor.motor_asyncio.AsyncIOMotorClient(settings.mongodb_url)
+            # connect=False: καμία σύνδεση μέχρι την πρώτη λειτουργία (ασφαλές σε fork)
+            client = motor.motor_asyncio.AsyncIOMotorClient(settings.mongodb_url, connect=False, **mongo_client_kwargs())
             self.db = client[settings.database_name]
         except Exception as e:
             logger.error(f"Error creating database connection: {str(e)}")
             raise
         self._collection = self.db["current_stations"]
-        # Δημιουργία geospatial index για location-based queries
-        self._collection.create_index([("location", GEOSPHERE)])
         # Προσθήκη σύγχρονου client για pymongo
-        self.sync_db = pymongo.MongoClient(settings.mongodb_url)  # Ρύθμιση με τη σωστή URL σύνδεσης
+        self.sync_db = pymongo.MongoClient(settings.mongodb_url, **mongo_client_kwargs())  # Ίδιες ρυθμίσεις pool/timeouts με τον κοινό client
         self.sync_collection = self.sync_db[settings.database_name]["current_stations"]
+        # Δημιουργία geospatial index για location-based queries.
+        # Μέσω του sync client, γιατί το motor create_index χωρίς await δεν εκτελείται ποτέ
+        self.sync_collection.create_index([("location", GEOSPHERE)])
+        # Index στο status για τα status filters
+        self.sync_collection.create_index([("status", ASCENDING)])
     
     @property
     def collection(self):
@@ -36,6 +44,11 @@ class StationRepository(BaseRepository[Station]):
     @property
     def model_class(self):
         return self._model_class
+
+    def close(self):
+        """Close the async and sync MongoDB clients of this repository"""
+        self.db.client.close()
+        self.sync_db.close()
     
     async def get_stations_by_location(
         self, 
@@ -44,56 +57,17 @@ class StationRepository(BaseRepository[Station]):
         radius_meters: int = 5000,
         limit: int = 50
     ) -> List[Station]:
-        """Get stations within radius of a location using geospatial query"""
+        """Get stations within radius of a location (alias of get_nearby_stations)"""
         try:
-            query = {
-                "location": {
-                    "$near": {
-                        "$geometry": {
-                            "type": "Point",
-                            "coordinates": [longitude, latitude]
-                        },
-                        "$maxDistance": radius_meters
-                    }
-                }
-            }
-            
-            cursor = self.collection.find(query).limit(limit)
-            docs = await cursor.to_list(length=limit)
-            
-            return [self.model_class(**doc) for doc in docs]
+            return await self.get_nearby_stations(latitude, longitude, radius_meters, limit)
         except Exception as e:
             logger.error(f"Error getting stations by location: {e}")
             raise
     
     async def bulk_upsert_stations(self, stations: List[Station]) -> Dict[str, Any]:
-        """Bulk upsert stations to database"""
-        if not stations:
-            return {"upserted": 0, "modified": 0}
-        
+        """Bulk upsert stations to database (alias of upsert_stations_batch)"""
         try:
-            operations = []
-            for station in stations:
-                # Χρησιμοποιούμε το Pydantic serialization
-                station_dict = station.model_dump(exclude={"id"}, mode="json")
-                
-                # Σωστό MongoDB operation format
-                operation = pymongo.ReplaceOne(
-                    filter={"tomtom_id": station.tomtom_id},
-                    replacement=station_dict,
-                    upsert=True
-                )
-                operations.append(operation)
-            
-            # Execute bulk operation
-            result = await self.collection.bulk_write(operations)
-            
-            return {
-                "upserted": result.upserted_count,
-                "modified": result.modified_count,
-                "matched": result.matched_count
-            }
-        
+            return await self.upsert_stations_batch(stations)
         except Exception as e:
             logger.error(f"Error in bulk upsert: {e}")
             raise
@@ -140,7 +114,7 @@ class StationRepository(BaseRepository[Station]):
 
     async def upsert_station(self, station: Station) -> str:
         """Upsert a station based on tomtom_id"""
-        station_dict = station.dict(by_alias=True)
+        station_dict = station.model_dump(by_alias=True, exclude={"id"})
         result = await self.collection.update_one(
             {"tomtom_id": station.tomtom_id},
             {"$set": station_dict},
@@ -153,54 +127,84 @@ class StationRepository(BaseRepository[Station]):
         if not stations:
             return {"matched": 0, "modified": 0, "upserted": 0}
         
-        operations = []
-        for station in stations:
-            station_data = station.dict(by_alias=True)
-            if '_id' in station_data:
-                del station_data['_id']
-            operation = pymongo.UpdateOne(
-                filter={"tomtom_id": station.tomtom_id},
-                update={"$set": station_data},
-                upsert=True
+        operations = [
+            self._station_upsert_operation(station.model_dump(by_alias=True, exclude={"id"}))
+            for station in stations
+        ]
+        counts = {"matched": 0, "modified": 0, "upserted": 0}
+        for start in range(0, len(operations), BULK_WRITE_BATCH_SIZE):
+            # ordered=False: ο server εκτελεί τα ops χωρίς να περιμένει το καθένα σειριακά
+            result = await self.collection.bulk_write(
+                operations[start:start + BULK_WRITE_BATCH_SIZE], ordered=False
             )
-            operations.append(operation)
-        
-        result = await self.collection.bulk_write(operations)
-        return {
-            "matched": result.matched_count,
-            "modified": result.modified_count,
-            "upserted": result.upserted_count
-        }
+            self._add_bulk_counts(counts, result)
+        return counts
     
     async def get_station_by_id(self, tomtom_id: str) -> Optional[Station]:
-        """Get a station by its TomTom ID"""
-        station_data = await self.collection.find_one({"tomtom_id": tomtom_id})
-        if station_data:
-            return Station(**station_data)
-        return None
+        """Get a station by its TomTom ID (alias of get_by_tomtom_id)"""
+        return await self.get_by_tomtom_id(tomtom_id)
     
+    @staticmethod
+    def _geo_near_stage(
+        latitude: float,
+        longitude: float,
+        radius_meters: float,
+        query: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Build the $geoNear stage shared by the nearby queries"""
+        # Index-driven pruning, το filter εφαρμόζεται μέσα στο geo stage
+        return {
+            "$geoNear": {
+                "near": {
+                    "type": "Point",
+                    "coordinates": [longitude, latitude]
+                },
+                "key": "location",
+                "distanceField": "distance_m",
+                "maxDistance": radius_meters,
+                "spherical": True,
+                "query": query or {}
+            }
+        }
+
     async def get_nearby_stations(
         self, 
         latitude: float, 
         longitude: float, 
         radius_meters: float, 
-        limit: int = 10
+        limit: int = 10,
+        filter_dict: Optional[Dict[str, Any]] = None
     ) -> List[Station]:
-        """Get nearby stations within radius sorted by distance"""
-        stations_data = await self.collection.find({
-            "location": {
-                "$near": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [longitude, latitude]
-                    },
-                    "$maxDistance": radius_meters
-                }
-            }
-        }).limit(limit).to_list(length=limit)
+        """Get nearby stations within radius sorted by distance, optionally filtered (e.g. by status)"""
+        pipeline = [
+            self._geo_near_stage(latitude, longitude, radius_meters, filter_dict),
+            {"$limit": limit}
+        ]
+        stations_data = await self.collection.aggregate(pipeline).to_list(length=limit)
         
         return [Station(**data) for data in stations_data]
     
+    async def get_nearby_station_summaries(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_meters: float,
+        limit: int = 10,
+        projection: Optional[Dict[str, Any]] = None,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get nearby stations as plain dicts with only the projected fields"""
+        projection = projection or {
+            "_id": 0, "tomtom_id": 1, "name": 1, "address": 1, "operator.name": 1, "status": 1
+        }
+        # Ίδιο $geoNear με το get_nearby_stations, αλλά ο server επιστρέφει μόνο τα πεδία που χρειάζονται
+        pipeline = [
+            self._geo_near_stage(latitude, longitude, radius_meters, filter_dict),
+            {"$limit": limit},
+            {"$project": projection}
+        ]
+        return await self.collection.aggregate(pipeline).to_list(length=limit)
+    
     async def get_stations_count(self) -> int:
         """Get total count of stations"""
         return await self.collection.count_documents({})
@@ -212,36 +216,33 @@ class StationRepository(BaseRepository[Station]):
 
     def upsert_stations_batch_sync(self, stations: List[Station]) -> Dict[str, int]:
         """Upsert multiple stations at once (synchronous)"""
+        return self.upsert_station_docs_sync(
+            [station.model_dump(by_alias=True, exclude={"id"}) for station in stations]
+        )
+
+    def upsert_station_docs_sync(self, station_docs: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Upsert already-serialized station documents at once (synchronous)"""
+        if not station_docs:
+            return {"matched": 0, "modified": 0, "upserted": 0}
+        
         try:
-            operations = []
-            for station in stations:
-                station_dict = station.dict(by_alias=True)
-                if '_id' in station_dict:
-                    del station_dict['_id']
-                operations.append(
-                    pymongo.UpdateOne(
-                        {"tomtom_id": station.tomtom_id},
-                        {"$set": station_dict},
-                        upsert=True
-                    )
-                )
+            operations = [self._station_upsert_operation(station_doc) for station_doc in station_docs]
             
-            result = self.sync_collection.bulk_write(operations)
-            return {
-                "matched": result.matched_count,
-                "modified": result.modified_count,
-                "upserted": result.upserted_count
-            }
+            counts = {"matched": 0, "modified": 0, "upserted": 0}
+            for start in range(0, len(operations), BULK_WRITE_BATCH_SIZE):
+                # ordered=False: ένα αποτυχημένο op δεν σταματά το υπόλοιπο batch
+                result = self.sync_collection.bulk_write(
+                    operations[start:start + BULK_WRITE_BATCH_SIZE], ordered=False
+                )
+                self._add_bulk_counts(counts, result)
+            return counts
         except Exception as e:
             logger.error(f"Error upserting stations batch (sync): {e}")
             raise
 
     async def get_station_by_tomtom_id(self, tomtom_id: str) -> Optional[Station]:
-        """Get a single station by its TomTom ID"""
-        station_data = await self.collection.find_one({"tomtom_id": tomtom_id})
-        if station_data:
-            return Station(**station_data)
-        return None
+        """Get a single station by its TomTom ID (alias of get_by_tomtom_id)"""
+        return await self.get_by_tomtom_id(tomtom_id)
 
     def get_station_by_tomtom_id_sync(self, tomtom_id: str) -> Optional[Station]:
         """Get a single station by its TomTom ID (synchronous)"""
@@ -254,6 +255,18 @@ class StationRepository(BaseRepository[Station]):
             logger.error(f"Error getting station by tomtom_id {tomtom_id} (sync): {e}")
             raise
 
+    def get_station_states_by_tomtom_ids_sync(self, tomtom_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get status and change counter for many stations with one $in query (synchronous)"""
+        try:
+            docs = self.sync_collection.find(
+                {"tomtom_id": {"$in": tomtom_ids}},
+                {"_id": 0, "tomtom_id": 1, "status": 1, "availability_status_changes_count": 1}
+            )
+            return {doc["tomtom_id"]: doc for doc in docs}
+        except Exception as e:
+            logger.error(f"Error getting station states for {len(tomtom_ids)} TomTom IDs (sync): {e}")
+            raise
+
     def get_all_station_tomtom_ids_sync(self) -> List[str]:
         """Get all TomTom IDs from current stations (synchronous)"""
         try:
@@ -296,18 +309,7 @@ class StationRepository(BaseRepository[Station]):
         It does not upsert; the station must exist.
         """
         try:
-            station_data = station.model_dump(by_alias=True, exclude_none=True)
-            # Remove fields that should not be in $set or are immutable
-            if '_id' in station_data:
-                del station_data['_id']
-            if 'id' in station_data and station_data['id'] is None: # Pydantic's own 'id' if not ObjectId
-                del station_data['id']
-            # tomtom_id is used in filter, not in $set
-            if 'tomtom_id' in station_data:
-                del station_data['tomtom_id']
-            # created_at should generally not be updated
-            if 'created_at' in station_data:
-                del station_data['created_at']
+            station_data = self._station_update_fields(station)
 
             if not station_data: # Nothing to set
                 logger.warning(f"No data to update for station {station.tomtom_id} after filtering fields.")
@@ -330,5 +332,64 @@ class StationRepository(BaseRepository[Station]):
             logger.error(f"Error updating station {station.tomtom_id} (sync): {e}", exc_info=True)
             raise # Re-raise the exception
 
+
+    def update_stations_batch_sync(self, stations: List[Station]) -> int:
+        """
+        Updates multiple existing stations with a single bulk write (synchronous).
+        Same field rules as update_station_sync; returns the number of modified stations.
+        """
+        operations = []
+        for station in stations:
+            station_data = self._station_update_fields(station)
+            if station_data:
+                operations.append(
+                    pymongo.UpdateOne({"tomtom_id": station.tomtom_id}, {"$set": station_data})
+                )
+        if not operations:
+            return 0
+
+        try:
+            result = self.sync_collection.bulk_write(operations, ordered=False)
+            logger.info(f"Bulk updated stations (sync): matched {result.matched_count}, modified {result.modified_count}.")
+            return result.modified_count
+        except Exception as e:
+            logger.error(f"Error bulk updating {len(operations)} stations (sync): {e}", exc_info=True)
+            raise
+
+    @staticmethod
+    def _add_bulk_counts(counts: Dict[str, int], result: BulkWriteResult) -> None:
+        """Accumulate the counts of one bulk_write into counts"""
+        counts["matched"] += result.matched_count
+        counts["modified"] += result.modified_count
+        counts["upserted"] += result.upserted_count
+
+    @staticmethod
+    def _station_upsert_operation(station_doc: Dict[str, Any]) -> pymongo.UpdateOne:
+        """Build the upsert operation for a serialized station document"""
+        # Το created_at γράφεται μόνο στο insert, όχι σε κάθε batch update
+        set_fields = {k: v for k, v in station_doc.items() if k not in ("_id", "created_at")}
+        return pymongo.UpdateOne(
+            {"tomtom_id": station_doc["tomtom_id"]},
+            {"$set": set_fields, "$setOnInsert": {"created_at": station_doc.get("created_at")}},
+            upsert=True
+        )
+
+    @staticmethod
+    def _station_update_fields(station: Station) -> Dict[str, Any]:
+        """Fields of a station that may be $set on an existing document"""
+        station_data = station.model_dump(by_alias=True, exclude_none=True)
+        # Remove fields that should not be in $set or are immutable
+        if '_id' in station_data:
+            del station_data['_id']
+        if 'id' in station_data and station_data['id'] is None: # Pydantic's own 'id' if not ObjectId
+            del station_data['id']
+        # tomtom_id is used in filter, not in $set
+        if 'tomtom_id' in station_data:
+            del station_data['tomtom_id']
+        # created_at should generally not be updated
+        if 'created_at' in station_data:
+            del station_data['created_at']
+        return station_data
+
 # Μην αρχικοποιούμε εδώ το instance
 # station_repository = StationRepository() 
\ No newline at end of file
@@ -2,17 +2,36 @@ from typing import Optional, List
 from app.repositories.base_repository import BaseRepository
 from app.models.user import User
 from passlib.context import CryptContext
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Argon2id για νέα hashes (παράμετροι OWASP), bcrypt κρατιέται για τα υπάρχοντα
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__memory_cost=46 * 1024,
+    argon2__time_cost=1,
+    argon2__parallelism=1,
+)
+
+async def hash_password(password: str) -> str:
+    """Hash a password without blocking the event loop"""
+    return await run_in_threadpool(pwd_context.hash, password)
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Verify a password without blocking the event loop"""
+    return await run_in_threadpool(pwd_context.verify, password, password_hash)
 
 class UserRepository(BaseRepository[User]):
     def __init__(self):
         # Lazy initialization
         self._collection = None
         self._model_class = User
+        self._background_tasks = set()
     
     @property
     def collection(self):
@@ -26,6 +45,28 @@ class UserRepository(BaseRepository[User]):
     def model_class(self):
         return self._model_class
     
+    def _run_in_background(self, coro):
+        """Schedule a write without awaiting it, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+    
+    def _on_background_task_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background user update failed: {task.exception()}")
+    
+    async def ensure_indexes(self):
+        """Create the unique email index that create_user relies on"""
+        try:
+            await self.collection.create_index("email", unique=True)
+        except OperationFailure as e:
+            # Υπάρχοντα διπλά emails εμποδίζουν το unique index - δεν σταματάμε το startup,
+            # αλλά χρειάζεται καθαρισμός των διπλοεγγραφών πριν το index δημιουργηθεί
+            logger.warning(
+                f"Could not create unique email index (duplicate emails must be merged or removed first): {e}"
+            )
+    
     async def get_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
         try:
@@ -40,7 +81,7 @@ class UserRepository(BaseRepository[User]):
     async def create_user(self, email: str, password: str, first_name: str, last_name: str, **kwargs) -> User:
         """Create new user with hashed password"""
         try:
-            hashed_password = pwd_context.hash(password)
+            hashed_password = await hash_password(password)
             user_data = {
                 "email": email,
                 "password_hash": hashed_password,
@@ -50,6 +91,9 @@ class UserRepository(BaseRepository[User]):
             }
             user = User(**user_data)
             return await self.create(user)
+        except DuplicateKeyError:
+            # Ο έλεγχος μοναδικότητας γίνεται από το unique index, χωρίς επιπλέον find
+            raise ValueError(f"Email already registered: {email}")
         except Exception as e:
             logger.error(f"Error creating user: {e}")
             raise
@@ -58,9 +102,13 @@ class UserRepository(BaseRepository[User]):
         """Authenticate user with email and password"""
         try:
             user = await self.get_by_email(email)
-            if user and pwd_context.verify(password, user.password_hash):
-                # Update last login
-                await self.update_by_id(user.id, {"last_login": datetime.utcnow()})
+            if user and await verify_password(password, user.password_hash):
+                update_data = {"last_login": datetime.utcnow()}
+                # Lazy migration των legacy bcrypt hashes σε argon2
+                if pwd_context.needs_update(user.password_hash):
+                    update_data["password_hash"] = await hash_password(password)
+                # Update last login στο background - δεν χρειάζεται για την απάντηση
+                self._run_in_background(self.update_by_id(user.id, update_data))
                 return user
             return None
         except Exception as e:
@@ -1,6 +1,9 @@
 import httpx
 import logging
-from typing import List, Optional, Dict, Any
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 from app.core.config import settings
 from app.core.exceptions import TomTomAPIException
@@ -18,6 +21,12 @@ logger = logging.getLogger(__name__)
 
 # Constants
 TOMTOM_AVAILABILITY_CHUNK_SIZE = 20 # Max IDs per call to availability endpoint
+TOMTOM_AVAILABILITY_MAX_WORKERS = 8 # Max concurrent availability requests
+TOMTOM_SEARCH_GRID_MAX_WORKERS = 9 # Max concurrent search requests for a tiled area
+METERS_PER_DEGREE_LAT = 111320.0
+TOMTOM_SEARCH_CACHE_MAX_ENTRIES = 256 # Όριο για το in-memory cache των async searches
+# Ένα keep-alive pool για όλες τις async κλήσεις προς TomTom
+TOMTOM_ASYNC_CLIENT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30)
 
 class TomTomService:
     def __init__(self):
@@ -25,8 +34,11 @@ class TomTomService:
         self.ev_api_key = getattr(settings, 'tomtom_ev_api_key', '') or "demo_key"
         self.search_base_url = "https://api.tomtom.com/search/2/search"
         self.ev_base_url = "https://api.tomtom.com/search/2/chargingAvailability"
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # HTTP/2: πολλά requests πολυπλέκονται πάνω σε μία TLS σύνδεση
+        self.client = httpx.AsyncClient(http2=True, limits=TOMTOM_ASYNC_CLIENT_LIMITS, timeout=30.0)
         self.sync_client = httpx.Client(timeout=30.0)  # Προσθήκη σύγχρονου client
+        # (lat, lon, radius) -> (expires_at, stations) για επαναλαμβανόμενα API searches
+        self._search_cache: Dict[Tuple[float, float, int], Tuple[float, List[Station]]] = {}
         
         if not self.search_api_key or self.search_api_key == "demo_key":
             logger.warning("TomTom Search API key not configured.")
@@ -45,12 +57,12 @@ class TomTomService:
         radius: int = 50000
     ) -> List[Station]:
         """Search for charging stations using TomTom Search API (async)"""
+        cache_key = (round(latitude, 4), round(longitude, 4), radius)
+        cached = self._search_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return list(cached[1])
+        
         try:
-            print(f"🔍 DEBUGGING: API Key = {self.search_api_key}")
-            print(f"🔍 DEBUGGING: Search URL = {self.search_base_url}")
-            print(f"🔍 DEBUGGING: Coordinates = ({latitude}, {longitude})")
-            print(f"🔍 DEBUGGING: Radius = {radius}")
-            
             # ΑΚΡΙΒΩΣ όπως στο Node-RED
             params = {
                 "key": self.search_api_key,
@@ -61,27 +73,18 @@ class TomTomService:
                 "categorySet": "7309"
             }
             
-            logger.info(f"TomTom API Request:")
-            logger.info(f"URL: {self.search_base_url}/electric%20vehicle%20charging%20station.json")
-            logger.info(f"Params: {params}")
-            logger.info(f"API Key: {self.search_api_key}")
+            # Χωρίς το API key στα logs
+            logger.debug("TomTom search request: (%s, %s) radius %sm", latitude, longitude, radius)
             
             response = await self.client.get(
                 f"{self.search_base_url}/electric%20vehicle%20charging%20station.json", 
                 params=params
             )
             
-            logger.info(f"Response Status: {response.status_code}")
-            logger.info(f"Response Headers: {dict(response.headers)}")
-            
             response.raise_for_status()
             data = response.json()
             
-            logger.info(f"Response Data Keys: {list(data.keys())}")
-            logger.info(f"Results Count: {len(data.get('results', []))}")
-            
-            if data.get('results'):
-                logger.info(f"First Result: {data['results'][0]}")
+            logger.debug("TomTom search response: status %s, %s results", response.status_code, len(data.get('results', [])))
             
             stations = []
             for result in data.get("results", []):
@@ -93,7 +96,8 @@ class TomTomService:
                     continue
             
             logger.info(f"Successfully parsed {len(stations)} charging stations")
-            return stations
+            self._cache_search_result(cache_key, stations)
+            return list(stations)
             
         except httpx.HTTPStatusError as e:
             logger.error(f"TomTom API HTTP error: {e}")
@@ -103,6 +107,18 @@ class TomTomService:
             logger.error(f"Error searching charging stations: {e}")
             raise TomTomAPIException(f"Failed to search charging stations: {str(e)}")
     
+    def _cache_search_result(self, cache_key: Tuple[float, float, int], stations: List[Station]) -> None:
+        """Store an async search result for settings.tomtom_cache_ttl_seconds"""
+        if settings.tomtom_cache_ttl_seconds <= 0:
+            return
+        now = time.monotonic()
+        if len(self._search_cache) >= TOMTOM_SEARCH_CACHE_MAX_ENTRIES:
+            # Πρώτα τα ληγμένα, μετά το παλαιότερο entry
+            self._search_cache = {k: v for k, v in self._search_cache.items() if v[0] > now}
+            if len(self._search_cache) >= TOMTOM_SEARCH_CACHE_MAX_ENTRIES:
+                del self._search_cache[next(iter(self._search_cache))]
+        self._search_cache[cache_key] = (now + settings.tomtom_cache_ttl_seconds, stations)
+    
     def search_charging_stations_sync(
         self, 
         latitude: float, 
@@ -111,11 +127,6 @@ class TomTomService:
     ) -> List[Station]:
         """Search for charging stations using TomTom Search API (synchronous)"""
         try:
-            print(f"🔍 DEBUGGING: API Key = {self.search_api_key}")
-            print(f"🔍 DEBUGGING: Search URL = {self.search_base_url}")
-            print(f"🔍 DEBUGGING: Coordinates = ({latitude}, {longitude})")
-            print(f"🔍 DEBUGGING: Radius = {radius}")
-            
             # ΑΚΡΙΒΩΣ όπως στο Node-RED
             params = {
                 "key": self.search_api_key,
@@ -126,27 +137,18 @@ class TomTomService:
                 "categorySet": "7309"
             }
             
-            logger.info(f"TomTom API Request:")
-            logger.info(f"URL: {self.search_base_url}/electric%20vehicle%20charging%20station.json")
-            logger.info(f"Params: {params}")
-            logger.info(f"API Key: {self.search_api_key}")
+            # Χωρίς το API key στα logs
+            logger.debug("TomTom search request: (%s, %s) radius %sm", latitude, longitude, radius)
             
             response = self.sync_client.get(
                 f"{self.search_base_url}/electric%20vehicle%20charging%20station.json", 
                 params=params
             )
             
-            logger.info(f"Response Status: {response.status_code}")
-            logger.info(f"Response Headers: {dict(response.headers)}")
-            
             response.raise_for_status()
             data = response.json()
             
-            logger.info(f"Response Data Keys: {list(data.keys())}")
-            logger.info(f"Results Count: {len(data.get('results', []))}")
-            
-            if data.get('results'):
-                logger.info(f"First Result: {data['results'][0]}")
+            logger.debug("TomTom search response: status %s, %s results", response.status_code, len(data.get('results', [])))
             
             stations = []
             for result in data.get("results", []):
@@ -168,6 +170,34 @@ class TomTomService:
             logger.error(f"Error searching charging stations: {e}")
             raise TomTomAPIException(f"Failed to search charging stations: {str(e)}")
     
+    def search_charging_stations_grid_sync(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: int = 50000,
+        grid_size: int = 3
+    ) -> List[Station]:
+        """
+        Search a large area as a grid_size x grid_size grid of smaller searches (synchronous).
+        Each TomTom search returns at most 100 results, so one large radius misses stations;
+        the cells are fetched concurrently and merged by tomtom_id.
+        """
+        cells = grid_cells(latitude, longitude, radius, grid_size)
+        logger.info(f"Searching ({latitude}, {longitude}) radius {radius}m as {len(cells)} grid cells")
+
+        stations_by_id: Dict[str, Station] = {}
+        with ThreadPoolExecutor(max_workers=min(len(cells), TOMTOM_SEARCH_GRID_MAX_WORKERS)) as executor:
+            results = executor.map(
+                lambda cell: self.search_charging_stations_sync(cell[0], cell[1], cell[2]),
+                cells
+            )
+            for cell_stations in results:
+                for station in cell_stations:
+                    stations_by_id.setdefault(station.tomtom_id, station)
+
+        logger.info(f"Grid search found {len(stations_by_id)} unique stations")
+        return list(stations_by_id.values())
+    
     def _parse_tomtom_station(self, result: Dict[str, Any]) -> Station:
         """Parse TomTom API result into Station model"""
         try:
@@ -211,6 +241,7 @@ class TomTomService:
             )
             
             # Create station
+            now = datetime.utcnow()
             station = Station(
                 tomtom_id=result.get("id", ""),
                 name=poi.get("name", "EV Charging Station"),
@@ -222,8 +253,8 @@ class TomTomService:
                 access_type="PUBLIC",
                 opening_hours=None,
                 amenities=[],
-                last_updated=datetime.utcnow(),
-                created_at=datetime.utcnow()
+                last_updated=now,
+                created_at=now
             )
             
             return station
@@ -253,10 +284,10 @@ class TomTomService:
             params['key'] = self._api_key_sync()
 
         try:
-            with httpx.Client(base_url=self.ev_base_url, timeout=30.0) as client:
-                response = client.get(endpoint, params=params)
-                response.raise_for_status()
-                return response.json()
+            # Κοινός sync client (keep-alive pool) αντί για νέο client/TLS handshake ανά κλήση
+            response = self.sync_client.get(f"{settings.tomtom_base_url}{endpoint}", params=params)
+            response.raise_for_status()
+            return response.json()
         except httpx.HTTPStatusError as e:
             logger.error(f"TomTom API HTTPStatusError for {e.request.url}: {e.response.status_code} - {e.response.text}")
             raise TomTomAPIException(f"TomTom API error: {e.response.status_code} - {e.response.text}", status_code=e.response.status_code)
@@ -378,75 +409,104 @@ class TomTomService:
     def get_stations_availability_sync(self, station_tomtom_ids: List[str]) -> List[Dict[str, Any]]:
         """
         Fetches real-time availability for a list of stations from TomTom.
-        Handles API calls in chunks if the list of IDs is large.
+        Handles API calls in chunks if the list of IDs is large; chunks are fetched concurrently.
         """
         if not station_tomtom_ids:
             return []
 
+        chunks = [
+            station_tomtom_ids[i:i + TOMTOM_AVAILABILITY_CHUNK_SIZE]
+            for i in range(0, len(station_tomtom_ids), TOMTOM_AVAILABILITY_CHUNK_SIZE)
+        ]
+
         all_availability_data = []
-        
-        for i in range(0, len(station_tomtom_ids), TOMTOM_AVAILABILITY_CHUNK_SIZE):
-            chunk_ids = station_tomtom_ids[i:i + TOMTOM_AVAILABILITY_CHUNK_SIZE]
-            ids_param = ",".join(chunk_ids)
-            
-            endpoint = "/search/2/chargingAvailability.json"
-            params = {
-                "chargingAvailability": ids_param,
-                "key": self._api_key_sync() # Ensure key is passed directly
-            }
-            
-            try:
-                logger.debug(f"Fetching availability for station IDs (chunk {i // TOMTOM_AVAILABILITY_CHUNK_SIZE + 1}): {chunk_ids}")
-                # We call _make_request_sync without params['key'] because it adds it.
-                # However, for this specific endpoint, the key is part of the main params.
-                # Let's adjust _make_request_sync or how we call it.
-                # For now, let's ensure the key is in params and _make_request_sync doesn't duplicate.
-                # The current _make_request_sync adds key if not present. So this is fine.
-
-                api_response = self._make_request_sync(endpoint, params)
-                
-                if api_response and "chargingAvailability" in api_response:
-                    parsed_chunk_data = []
-                    for station_avail_data in api_response["chargingAvailability"]:
-                        station_id = station_avail_data.get("id")
-                        overall_status_obj = station_avail_data.get("availability", {})
-                        overall_status = overall_status_obj.get("status", "UNKNOWN").upper()
-                        if overall_status == "BUSY": # Normalize
-                            overall_status = "OCCUPIED"
-
-                        connectors_availability = []
-                        for conn_data in station_avail_data.get("connectors", []):
-                            conn_id = conn_data.get("id")
-                            conn_status_obj = conn_data.get("availability", {})
-                            conn_status = conn_status_obj.get("status", "UNKNOWN").upper()
-                            if conn_status == "BUSY": # Normalize
-                                conn_status = "OCCUPIED"
-                            
-                            if conn_id:
-                                connectors_availability.append({
-                                    "id": conn_id,
-                                    "status": conn_status
-                                })
-                        
-                        if station_id:
-                            parsed_chunk_data.append({
-                                "tomtom_id": station_id,
-                                "overall_status": overall_status,
-                                "connectors": connectors_availability
-                            })
-                    all_availability_data.extend(parsed_chunk_data)
-                    logger.info(f"Successfully fetched and parsed availability for {len(parsed_chunk_data)} stations in chunk.")
-                else:
-                    logger.warning(f"Received empty or invalid availability response for chunk: {chunk_ids}")
-
-            except TomTomAPIException as e:
-                logger.error(f"TomTom API Exception while fetching availability for IDs {chunk_ids}: {e}")
-                # Continue to next chunk, or re-raise? For now, log and continue.
-            except Exception as e:
-                logger.error(f"Unexpected error fetching availability for IDs {chunk_ids}: {e}", exc_info=True)
+        # Τα chunks είναι ανεξάρτητα HTTP calls - παράλληλα με όριο ταυτόχρονων requests
+        with ThreadPoolExecutor(max_workers=TOMTOM_AVAILABILITY_MAX_WORKERS) as executor:
+            for chunk_data in executor.map(self._fetch_availability_chunk_sync, chunks):
+                all_availability_data.extend(chunk_data)
         
         logger.info(f"Total availability data fetched for {len(all_availability_data)} stations across all chunks.")
         return all_availability_data
 
+    def _fetch_availability_chunk_sync(self, chunk_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch and parse availability for a single chunk of station IDs"""
+        ids_param = ",".join(chunk_ids)
+        
+        endpoint = "/search/2/chargingAvailability.json"
+        params = {
+            "chargingAvailability": ids_param,
+            "key": self._api_key_sync() # Ensure key is passed directly
+        }
+        
+        try:
+            logger.debug(f"Fetching availability for station IDs: {chunk_ids}")
+            api_response = self._make_request_sync(endpoint, params)
+            
+            if not api_response or "chargingAvailability" not in api_response:
+                logger.warning(f"Received empty or invalid availability response for chunk: {chunk_ids}")
+                return []
+
+            parsed_chunk_data = []
+            for station_avail_data in api_response["chargingAvailability"]:
+                station_id = station_avail_data.get("id")
+                overall_status_obj = station_avail_data.get("availability", {})
+                overall_status = overall_status_obj.get("status", "UNKNOWN").upper()
+                if overall_status == "BUSY": # Normalize
+                    overall_status = "OCCUPIED"
+
+                connectors_availability = []
+                for conn_data in station_avail_data.get("connectors", []):
+                    conn_id = conn_data.get("id")
+                    conn_status_obj = conn_data.get("availability", {})
+                    conn_status = conn_status_obj.get("status", "UNKNOWN").upper()
+                    if conn_status == "BUSY": # Normalize
+                        conn_status = "OCCUPIED"
+                    
+                    if conn_id:
+                        connectors_availability.append({
+                            "id": conn_id,
+                            "status": conn_status
+                        })
+                
+                if station_id:
+                    parsed_chunk_data.append({
+                        "tomtom_id": station_id,
+                        "overall_status": overall_status,
+                        "connectors": connectors_availability
+                    })
+            logger.info(f"Successfully fetched and parsed availability for {len(parsed_chunk_data)} stations in chunk.")
+            return parsed_chunk_data
+
+        except TomTomAPIException as e:
+            logger.error(f"TomTom API Exception while fetching availability for IDs {chunk_ids}: {e}")
+            # Log and continue with the remaining chunks
+        except Exception as e:
+            logger.error(f"Unexpected error fetching availability for IDs {chunk_ids}: {e}", exc_info=True)
+        return []
+
+def grid_cells(latitude: float, longitude: float, radius: int, grid_size: int = 3) -> List[Tuple[float, float, int]]:
+    """
+    Split the square around a search circle into grid_size x grid_size cells.
+    Returns (lat, lon, radius) per cell; each cell radius covers its square's corners.
+    """
+    if grid_size <= 1:
+        return [(latitude, longitude, radius)]
+
+    cell_side = 2 * radius / grid_size
+    cell_radius = int(math.ceil(cell_side / math.sqrt(2)))
+    meters_per_degree_lon = METERS_PER_DEGREE_LAT * math.cos(math.radians(latitude))
+
+    cells = []
+    for row in range(grid_size):
+        for col in range(grid_size):
+            offset_y = -radius + cell_side * (row + 0.5)
+            offset_x = -radius + cell_side * (col + 0.5)
+            cells.append((
+                latitude + offset_y / METERS_PER_DEGREE_LAT,
+                longitude + offset_x / meters_per_degree_lon,
+                cell_radius
+            ))
+    return cells
+
 # Singleton instance
 tomtom_service = TomTomService() 
\ No newline at end of file
@@ -1,50 +1,53 @@
 import logging
 from datetime import datetime
-from typing import List
+from typing import List, Dict, Any
 import asyncio
 
+from celery import group
 from app.core.celery_config import celery_app
+from app.core.config import settings
 from app.services.tomtom_service import tomtom_service
-from app.repositories import station_repo, historical_repo
+from app.repositories import get_station_repository, get_historical_repository
 from app.models.station import Station
-from app.database.connection import get_database
-from app.repositories.station_repository import StationRepository
-from app.repositories.historical_repository import HistoricalStationRepository
-from app.core.config import settings  # Προσθήκη για να πάρουμε τη MongoDB URL
-import motor.motor_asyncio  # Προσθήκη για χειροκίνητη σύνδεση
+from app.utils.redis_client import get_sync_redis
 
 logger = logging.getLogger(__name__)
 
-# Αρχικοποίηση της σύνδεσης με τη βάση δεδομένων
-def init_database():
+# Μέγιστη διάρκεια του in-flight lock αν το task δεν το απελευθερώσει.
+# Τουλάχιστον όσο το task_time_limit (3600s) ώστε να μη λήγει πριν τελειώσει το task
+BATCH_UPDATE_LOCK_TTL_SECONDS = 3600 + 600
+
+def batch_update_lock_key(latitude: float, longitude: float, radius: int) -> str:
+    """Redis key marking a batch update in flight for the given area"""
+    return f"batch:{latitude}:{longitude}:{radius}"
+
+# Atomic compare-and-delete: μόνο ο κάτοχος του lock το σβήνει
+RELEASE_BATCH_UPDATE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def _release_batch_update_lock(task_id: str, latitude: float, longitude: float, radius: int) -> None:
+    """Delete the in-flight key if it belongs to the current task"""
     try:
-        client = motor.motor_asyncio.AsyncIOMotorClient(settings.mongodb_url)
-        db = client[settings.database_name]
-        logger.info("Database connection initialized manually")
-        return db
+        redis_client = get_sync_redis()
+        key = batch_update_lock_key(latitude, longitude, radius)
+        redis_client.eval(RELEASE_BATCH_UPDATE_LOCK_SCRIPT, 1, key, task_id)
     except Exception as e:
-        logger.error(f"Error initializing database connection: {str(e)}")
-        raise
-
-# Αρχικοποίηση των repositories αν δεν είναι ήδη αρχικοποιημένα
-def init_repositories():
-    global station_repo, historical_repo
-    if station_repo is None:
-        logger.info("Initializing station repository")
-        station_repo = StationRepository()
-    if historical_repo is None:
-        logger.info("Initializing historical repository")
-        historical_repo = HistoricalStationRepository()
+        logger.warning(f"Could not release batch update lock: {e}")
 
 @celery_app.task(
     name='app.tasks.batch_tasks.batch_update_stations',
+    bind=True,
     retry_backoff=True,
     retry_jitter=True,
     autoretry_for=(Exception,),
     max_retries=3,
     retry_backoff_max=600,
 )
-def batch_update_stations(latitude: float, longitude: float, radius: int) -> dict:
+def batch_update_stations(self, latitude: float, longitude: float, radius: int, grid_size: int = 1) -> dict:
     """
     Batch update stations from TomTom API for a given location and radius.
     This task fetches station data, upserts it to current_stations collection,
@@ -55,6 +58,7 @@ def batch_update_stations(latitude: float, longitude: float, radius: int) -> dic
         latitude (float): Latitude of the center point for search
         longitude (float): Longitude of the center point for search
         radius (int): Search radius in meters
+        grid_size (int): Split the area into grid_size x grid_size searches (1 = single search)
         
     Returns:
         dict: Summary of the batch operation
@@ -62,20 +66,30 @@ def batch_update_stations(latitude: float, longitude: float, radius: int) -> dic
     try:
         logger.info(f"Starting batch update for stations at ({latitude}, {longitude}) with radius {radius}m")
         
-        # Αρχικοποίηση των repositories πριν από τη χρήση
-        init_repositories()
+        # Τα repositories δημιουργούνται μία φορά ανά worker process
+        station_repo = get_station_repository()
+        historical_repo = get_historical_repository()
         
         # Fetch stations from TomTom API using synchronous method
-        stations_from_api: List[Station] = tomtom_service.search_charging_stations_sync(
-            latitude=latitude,
-            longitude=longitude,
-            radius=radius
-        )
+        if grid_size > 1:
+            stations_from_api: List[Station] = tomtom_service.search_charging_stations_grid_sync(
+                latitude=latitude,
+                longitude=longitude,
+                radius=radius,
+                grid_size=grid_size
+            )
+        else:
+            stations_from_api: List[Station] = tomtom_service.search_charging_stations_sync(
+                latitude=latitude,
+                longitude=longitude,
+                radius=radius
+            )
         
         logger.info(f"Fetched {len(stations_from_api)} stations from TomTom API")
 
         if not stations_from_api:
             logger.info("No stations fetched from TomTom API. Skipping further processing.")
+            _release_batch_update_lock(self.request.id, latitude, longitude, radius)
             return {
                 "status": "success",
                 "message": "No stations found or fetched from TomTom API.",
@@ -101,47 +115,51 @@ def batch_update_stations(latitude: float, longitude: float, radius: int) -> dic
         if removed_station_ids:
             logger.debug(f"Removed/missing station IDs: {removed_station_ids}")
 
+        # Ένα $in query για όλα τα υπάρχοντα stations αντί για ένα find ανά station
+        existing_states = station_repo.get_station_states_by_tomtom_ids_sync(list(fetched_api_tomtom_ids))
+
         stations_to_upsert: List[Station] = []
         for station_api_data in stations_from_api:
-            existing_station_doc = station_repo.get_station_by_tomtom_id_sync(station_api_data.tomtom_id)
+            existing_state = existing_states.get(station_api_data.tomtom_id)
             
             current_availability_changes = station_api_data.availability_status_changes_count # Default is 0 from model
 
-            if existing_station_doc:
+            if existing_state:
                 # Preserve existing count if field exists, otherwise start from model default (which is 0)
-                current_availability_changes = getattr(existing_station_doc, 'availability_status_changes_count', 0)
-                if existing_station_doc.status != station_api_data.status:
+                current_availability_changes = existing_state.get('availability_status_changes_count', 0)
+                if existing_state.get('status') != station_api_data.status:
                     current_availability_changes += 1
             
             # Update the station object fetched from API with the new count
             station_api_data.availability_status_changes_count = current_availability_changes
             stations_to_upsert.append(station_api_data)
         
+        # Ένα serialization ανά station - τα ίδια dicts για upsert και ιστορικό
+        station_docs = [station.model_dump(by_alias=True, exclude={"id"}) for station in stations_to_upsert]
+
         # Upsert stations to current_stations collection using synchronous method
-        upsert_result = station_repo.upsert_stations_batch_sync(stations_to_upsert)
+        upsert_result = station_repo.upsert_station_docs_sync(station_docs)
         logger.info(f"Upserted stations to current_stations: {upsert_result}")
         
         # Prepare historical data with status snapshot
         historical_data = []
-        for station in stations_to_upsert: # Use stations_to_upsert which has updated counts
-            station_dict = station.dict(by_alias=True)
+        # Ένα κοινό timestamp για όλο το batch snapshot
+        snapshot_time = datetime.utcnow()
+        for station, station_doc in zip(stations_to_upsert, station_docs): # Use stations_to_upsert which has updated counts
+            # Shallow copy: το insert_many προσθέτει _id στο dict
+            station_dict = dict(station_doc)
             station_dict['station_id'] = station.tomtom_id # Ensure station_id for historical records
-            station_dict['status_snapshot'] = {
-                "station_status": station.status,
-                "total_connectors": len(station.connectors),
-                "available_connectors": sum(1 for c in station.connectors if c.status == "AVAILABLE"),
-                "occupied_connectors": sum(1 for c in station.connectors if c.status == "OCCUPIED"),
-                "out_of_order_connectors": sum(1 for c in station.connectors if c.status == "OUT_OF_ORDER")
-            }
-            station_dict['timestamp'] = datetime.utcnow()
-            if '_id' in station_dict: # Remove MongoDB's _id if it was somehow included from an existing doc
-                del station_dict['_id']
+            station_dict['status_snapshot'] = station.status_snapshot()
+            station_dict['timestamp'] = snapshot_time
             historical_data.append(station_dict)
         
         # Save to historical_stations collection using synchronous method
-        historical_count = historical_repo.save_historical_batch_sync(historical_data)
+        historical_count = historical_repo.save_historical_batch_sync(
+            historical_data, fast_insert=settings.historical_fast_insert
+        )
         logger.info(f"Saved {historical_count} records to historical_stations")
         
+        _release_batch_update_lock(self.request.id, latitude, longitude, radius)
         return {
             "status": "success",
             "message": f"Batch update completed for {len(stations_to_upsert)} stations",
@@ -155,13 +173,45 @@ def batch_update_stations(latitude: float, longitude: float, radius: int) -> dic
         
     except Exception as e:
         logger.error(f"Error in batch_update_stations: {str(e)}")
-        raise 
+        # Το lock κρατιέται όσο ακολουθούν retries - απελευθερώνεται μόνο στην τελευταία αποτυχία
+        if self.request.retries >= self.max_retries:
+            _release_batch_update_lock(self.request.id, latitude, longitude, radius)
+        raise
+
+@celery_app.task(name='app.tasks.batch_tasks.batch_update_all_stations')
+def batch_update_all_stations(locations: List[Dict[str, Any]]) -> dict:
+    """
+    Dispatch batch_update_stations for every monitored location as one group.
+    
+    Args:
+        locations (List[dict]): Entries with latitude, longitude, radius and optional name/grid_size
+        
+    Returns:
+        dict: The group id and the dispatched location names
+    """
+    job = group(
+        batch_update_stations.s(
+            location["latitude"],
+            location["longitude"],
+            location["radius"],
+            location.get("grid_size", 1)
+        )
+        for location in locations
+    )
+    # Δεν περιμένουμε τα αποτελέσματα μέσα σε task - κάθε περιοχή τρέχει ανεξάρτητα
+    group_result = job.apply_async()
+    logger.info(f"Dispatched batch updates for {len(locations)} locations (group {group_result.id})")
+    return {
+        "status": "dispatched",
+        "group_id": group_result.id,
+        "locations": [location.get("name") for location in locations]
+    }
 
 @celery_app.task(name='app.tasks.batch_tasks.cleanup_old_historical_data')
 def cleanup_old_historical_data_task(days_to_keep: int = 30):
     logger.info(f"Starting cleanup of historical data older than {days_to_keep} days.")
     try:
-        init_repositories() # Διασφαλίζει ότι τα repositories είναι αρχικοποιημένα
+        historical_repo = get_historical_repository()
 
         # Η μέθοδος cleanup_old_data στο HistoricalStationRepository είναι async.
         # Την καλούμε από ένα σύγχρονο Celery task χρησιμοποιώντας asyncio.run().
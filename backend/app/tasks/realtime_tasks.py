@@ -4,7 +4,7 @@ from typing import List, Dict, Any
 
 from app.core.celery_config import celery_app
 from app.services.tomtom_service import tomtom_service
-from app.repositories import station_repo, init_repositories
+from app.repositories import get_station_repository
 from app.models.station import Station, ConnectorInfo
 
 logger = logging.getLogger(__name__)
@@ -24,7 +24,7 @@ def poll_station_availability() -> Dict[str, Any]:
     Polls TomTom API for real-time availability of stations and updates the database.
     """
     try:
-        init_repositories() # Ensure repositories are initialized in the Celery worker process
+        station_repo = get_station_repository() # Shared per Celery worker process
         logger.info("Starting real-time availability poll for stations.")
 
         if not station_repo:
@@ -47,7 +47,7 @@ def poll_station_availability() -> Dict[str, Any]:
             logger.info("No availability data returned from TomTom service.")
             return {"status": "success", "message": "No availability data from TomTom.", "updated_count": 0, "checked_count": len(station_tomtom_ids)}
 
-        updated_stations_count = 0
+        changed_stations: List[Station] = []
         processed_station_ids = set()
 
         for avail_data in availability_data_list:
@@ -96,15 +96,7 @@ def poll_station_availability() -> Dict[str, Any]:
             
             if station_changed:
                 existing_station.last_updated = datetime.utcnow()
-                try:
-                    update_success = station_repo.update_station_sync(existing_station)
-                    if update_success:
-                        logger.info(f"Successfully updated station {tomtom_id} with new availability.")
-                        updated_stations_count += 1
-                    else:
-                        logger.warning(f"Update reported no modification for station {tomtom_id}, though changes were detected.")
-                except Exception as e_update:
-                    logger.error(f"Error updating station {tomtom_id} in DB: {e_update}", exc_info=True)
+                changed_stations.append(existing_station)
             else:
                 # Even if no data change, we might want to update 'last_updated' to show it was checked.
                 # However, for this layer, we only update if there's an actual data change.
@@ -113,6 +105,13 @@ def poll_station_availability() -> Dict[str, Any]:
                 # station_repo.update_station_sync(existing_station) # This would require update_station_sync to handle no-change updates gracefully
                 logger.debug(f"No availability changes detected for station {tomtom_id}.")
 
+        # 5. Όλες οι αλλαγές σε ένα bulk write αντί για ένα update ανά station
+        updated_stations_count = 0
+        if changed_stations:
+            try:
+                updated_stations_count = station_repo.update_stations_batch_sync(changed_stations)
+            except Exception as e_update:
+                logger.error(f"Error bulk updating {len(changed_stations)} stations in DB: {e_update}", exc_info=True)
 
         logger.info(f"Real-time availability poll finished. Checked: {len(processed_station_ids)} stations. Updated: {updated_stations_count} stations.")
         return {
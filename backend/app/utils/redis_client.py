@@ -0,0 +1,50 @@
+import logging
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Ένας client ανά process - δημιουργείται στην πρώτη χρήση (μετά το fork των workers)
+_async_client: Optional[aioredis.Redis] = None
+_sync_client: Optional[redis.Redis] = None
+
+# Κοινές ρυθμίσεις pool: όριο συνδέσεων, TCP keepalive και έλεγχος για νεκρές idle συνδέσεις
+REDIS_POOL_OPTIONS = {
+    "max_connections": settings.redis_max_connections,
+    "socket_keepalive": True,
+    "health_check_interval": 30,
+    "decode_responses": True,
+}
+
+def get_async_redis() -> aioredis.Redis:
+    """Get the process-wide asyncio Redis client (FastAPI side)"""
+    global _async_client
+    if _async_client is None:
+        pool = aioredis.ConnectionPool.from_url(settings.redis_url, **REDIS_POOL_OPTIONS)
+        _async_client = aioredis.Redis(connection_pool=pool)
+    return _async_client
+
+def get_sync_redis() -> redis.Redis:
+    """Get the process-wide synchronous Redis client (Celery side)"""
+    global _sync_client
+    if _sync_client is None:
+        pool = redis.ConnectionPool.from_url(settings.redis_url, **REDIS_POOL_OPTIONS)
+        _sync_client = redis.Redis(connection_pool=pool)
+    return _sync_client
+
+async def close_async_redis():
+    """Close the asyncio Redis client"""
+    global _async_client
+    try:
+        if _async_client is not None:
+            # Το pool δόθηκε απ' έξω, οπότε το κλείνουμε ρητά
+            await _async_client.aclose(close_connection_pool=True)
+            _async_client = None
+            logger.info("Disconnected from Redis")
+    except Exception as e:
+        logger.error(f"Error disconnecting from Redis: {e}")
+        raise
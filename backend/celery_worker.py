@@ -12,12 +12,14 @@ from app.core.celery_config import celery_app
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Ensure tasks are loaded
-# This line is crucial to register the tasks with Celery
-celery_app.autodiscover_tasks(['app.tasks'], force=True)
+# Τα task modules φορτώνονται από το include του celery_app - δεν χρειάζεται autodiscover
 
 logger.info("Starting Celery worker...")
 
+# Ουρές που καταναλώνει ο worker (βλ. task_routes στο celery_config).
+# Default και οι δύο· για ξεχωριστά pools π.χ. CELERY_QUEUES=batch_queue και CELERY_QUEUES=realtime_queue
+CELERY_QUEUES = os.getenv("CELERY_QUEUES", "batch_queue,realtime_queue")
+
 # Start the worker
 if __name__ == "__main__":
-    celery_app.start(argv=['worker', '--loglevel=info']) 
\ No newline at end of file
+    celery_app.start(argv=['worker', '--loglevel=info', '-Q', CELERY_QUEUES]) 
\ No newline at end of file